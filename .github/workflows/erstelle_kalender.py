@@ -17,16 +17,27 @@ Ausgabe: public/calendar/index.html
 from __future__ import annotations
 
 import os
+import re
 import sys
 import html
+import operator
 import requests
 from icalendar import Calendar
 from zoneinfo import ZoneInfo
+from functools import lru_cache
+from dataclasses import dataclass
 from dateutil.rrule import rrulestr
 from datetime import datetime, date, time, timedelta
 from typing import Any, Dict, List
 
 OUTPUT_HTML_FILE = "public/calendar/index.html"
+# Nicht unter public/ ablegen: das Verzeichnis wird veröffentlicht
+ICS_CACHE_FILE = ".cache/calendar/kalender.ics"
+ICS_ETAG_FILE = ICS_CACHE_FILE + ".etag"
+
+SESSION = requests.Session()
+# gzip/deflate fordert requests bereits standardmäßig an
+SESSION.headers.update({"User-Agent": "snapshots-kalender/1.0"})
 
 
 # ----------------------------- Hilfsfunktionen (Zeit) -----------------------------
@@ -37,6 +48,15 @@ def to_local(dt_raw: date | datetime, tz_local: ZoneInfo) -> datetime:
     - DATE (Ganztag): 00:00 lokale Zeit
     - DATETIME mit/ohne tzinfo: in lokale Zeit umrechnen (naiv = lokal)
     """
+    # Schon lokal: keine Umrechnung, kein Cache-Lookup
+    if type(dt_raw) is datetime and dt_raw.tzinfo is tz_local:
+        return dt_raw
+    return _to_local_cached(dt_raw, tz_local)
+
+
+@lru_cache(maxsize=8192)
+def _to_local_cached(dt_raw: date | datetime, tz_local: ZoneInfo) -> datetime:
+    """Eigentliche Umrechnung für to_local (gleiche Zeitwerte wiederholen sich oft)."""
     if isinstance(dt_raw, date) and not isinstance(dt_raw, datetime):
         return datetime.combine(dt_raw, time.min, tzinfo=tz_local)
     if isinstance(dt_raw, datetime):
@@ -56,19 +76,233 @@ def is_all_day_component(component) -> bool:
     return isinstance(v, date) and not isinstance(v, datetime)
 
 
+# ----------------------------- Hilfsfunktionen (HTML) ------------------------------
+
+_NEEDS_ESCAPE = re.compile(r'[&<>"\']')
+
+
+def _esc(s: str) -> str:
+    """html.escape, gibt aber Texte ohne Sonderzeichen unverändert (ohne Kopie) zurück."""
+    return html.escape(s) if _NEEDS_ESCAPE.search(s) else s
+
+
+def location_html(location: str) -> str:
+    """Fertiges Orts-Fragment für die Ausgabe (einmal je Termin, nicht je Vorkommen)."""
+    return f'<div class="meta">{_esc(location)}</div>' if location else ""
+
+
+# ----------------------------- Wiederholungen (RRULE) ------------------------------
+
+_WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+_FAST_RRULE_KEYS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST", "BYDAY"}
+
+
+@lru_cache(maxsize=1024)
+def _compile_rrule(rule_str: str, dtstart: datetime):
+    """
+    Parst eine RRULE nur einmal je (Regeltext, DTSTART).
+    cache=True: bereits berechnete Vorkommen bleiben am (wiederverwendeten) Objekt hängen.
+    """
+    return rrulestr(rule_str, dtstart=dtstart, cache=True)
+
+
+def fast_between(rrule_prop, dtstart: datetime, lo: datetime, hi: datetime) -> List[datetime]:
+    """
+    Liefert alle Vorkommen einer RRULE in [lo, hi] (inklusive).
+
+    Einfache DAILY/WEEKLY-Regeln (INTERVAL, COUNT, UNTIL, WEEKLY mit BYDAY) werden
+    direkt ab dem ersten Vorkommen >= lo berechnet, statt wie dateutil ab DTSTART
+    vorwärts zu iterieren. Alles andere läuft über rrulestr().between().
+    Regeln, die laut DTSTART/UNTIL/COUNT nicht ins Fenster reichen, werden gar nicht erst geparst.
+    """
+    freq = (rrule_prop.get("FREQ") or [None])[0]
+    interval = int((rrule_prop.get("INTERVAL") or [1])[0])
+    count = rrule_prop.get("COUNT")
+    until = (rrule_prop.get("UNTIL") or [None])[0]
+    byday = rrule_prop.get("BYDAY") or []
+
+    # Schnelltests: beginnt nach dem Fenster bzw. endet (UNTIL) davor
+    if dtstart > hi:
+        return []
+    if until is not None:
+        until_bound = until if isinstance(until, datetime) else datetime.combine(until, time.max)
+        if until_bound.tzinfo is None:
+            until_bound = until_bound.replace(tzinfo=dtstart.tzinfo)
+        if until_bound < lo:
+            return []
+
+    simple = (
+        freq in ("DAILY", "WEEKLY")
+        and interval > 0
+        and set(rrule_prop) <= _FAST_RRULE_KEYS
+        and (not byday or (freq == "WEEKLY" and all(str(d) in _WEEKDAYS for d in byday)))
+    )
+    if simple and count:
+        # Jede Periode ab der zweiten liefert mind. ein Vorkommen → Ende nach COUNT+1 Perioden
+        period = timedelta(days=interval * (7 if freq == "WEEKLY" else 1))
+        if dtstart + (int(count[0]) + 1) * period < lo:
+            return []
+
+    fast = (
+        simple
+        and dtstart.tzinfo is not None
+        and dtstart.tzinfo is lo.tzinfo is hi.tzinfo
+        # UNTIL als DATE bzw. ohne Zeitzone: Sonderbehandlung in dateutil
+        and (until is None or (isinstance(until, datetime) and until.tzinfo is not None))
+        and not (byday and count)
+    )
+    if not fast:
+        rule = _compile_rrule(rrule_prop.to_ical().decode(), dtstart)
+        return rule.between(lo, hi, inc=True)
+
+    dtstart = dtstart.replace(microsecond=0)
+    if until is not None and until < hi:
+        hi = until
+    if count:
+        count = int(count[0])
+    result: List[datetime] = []
+
+    if not byday:
+        # Gleichmäßiger Abstand: Indexbereich [first, stop) der Vorkommen direkt ausrechnen.
+        # Schritte laufen in Wanduhrzeit (wie dateutil), daher nicht über Epoch-Sekunden;
+        # +1 Index Puffer für die Zeitumstellung, der Filter auf hi entscheidet exakt.
+        step = timedelta(days=interval * (7 if freq == "WEEKLY" else 1))
+        first = max(0, -((dtstart - lo) // step))
+        stop = (hi.astimezone(dtstart.tzinfo) - dtstart) // step + 2
+        if count:
+            stop = min(stop, count)
+        return [occ for k in range(first, stop) if (occ := dtstart + k * step) <= hi]
+
+    # WEEKLY mit BYDAY: Wochen ab WKST, nur jede INTERVAL-te Woche ist aktiv
+    wkst = _WEEKDAYS.get(str((rrule_prop.get("WKST") or ["MO"])[0]), 0)
+    offsets = sorted({(_WEEKDAYS[str(d)] - wkst) % 7 for d in byday})
+    start_offset = (dtstart.weekday() - wkst) % 7
+    week = max(0, (lo.date() - dtstart.date()).days + start_offset) // 7
+    week += -week % interval
+    while True:
+        week_start = dtstart + timedelta(days=7 * week - start_offset)
+        if week_start > hi:
+            return result
+        for offset in offsets:
+            occ = week_start + timedelta(days=offset)
+            if occ > hi:
+                return result
+            if occ >= lo and occ >= dtstart:
+                result.append(occ)
+        week += interval
+
+
+# -------------------------------- ICS herunterladen --------------------------------
+
+def fetch_ics(ics_url: str) -> bytes:
+    """
+    Lädt die ICS-Datei als Bytes über die gemeinsame Session.
+    Ist ein ETag aus dem letzten Lauf vorhanden (im Workflow per actions/cache wiederhergestellt),
+    wird er mitgeschickt; bei 304 kommt der lokale Cache zurück.
+    """
+    headers: Dict[str, str] = {}
+    cached: bytes | None = None
+    try:
+        with open(ICS_ETAG_FILE, encoding="utf-8") as f:
+            etag = f.read().strip()
+        with open(ICS_CACHE_FILE, "rb") as f:
+            cached = f.read()
+        if etag:
+            headers["If-None-Match"] = etag
+    except OSError:
+        cached = None
+
+    response = SESSION.get(ics_url, timeout=(5, 30), headers=headers)
+    if response.status_code == 304 and cached is not None:
+        return cached
+    response.raise_for_status()
+
+    content = response.content
+    etag = response.headers.get("ETag")
+    if etag:
+        try:
+            os.makedirs(os.path.dirname(ICS_CACHE_FILE), exist_ok=True)
+            with open(ICS_CACHE_FILE, "wb") as f:
+                f.write(content)
+            with open(ICS_ETAG_FILE, "w", encoding="utf-8") as f:
+                f.write(etag)
+        except OSError as e:
+            print(f"Hinweis: ICS-Cache konnte nicht geschrieben werden: {e}", file=sys.stderr)
+    return content
+
+
+# ------------------------------- ICS vorfiltern ---------------------------------
+
+_VEVENT_BLOCK_RE = re.compile(rb"BEGIN:VEVENT\r?\n.*?END:VEVENT\r?\n", re.S)
+_DTSTART_DATE_RE = re.compile(rb"^DTSTART[^:\r\n]*:(\d{8})", re.M)
+_DTEND_DATE_RE = re.compile(rb"^DTEND[^:\r\n]*:(\d{8})", re.M)
+_DURATION_RE = re.compile(rb"^DURATION[;:]", re.M)
+# Wiederholungen und Overrides können unabhängig von DTSTART in die Woche fallen;
+# Absagen tragen keine Dauer des abgesagten Vorkommens, das bis in die Woche reichen kann
+_ALWAYS_KEEP_RE = re.compile(rb"^(?:RRULE|RDATE|RECURRENCE-ID)[;:]|^STATUS:(?i:CANCELLED)\s*$", re.M)
+
+
+def filter_ics_window(content: bytes, first_day: date, last_day: date) -> bytes:
+    """
+    Entfernt nicht abgesagte Einzeltermine, die sicher außerhalb von [first_day, last_day]
+    liegen, bevor icalendar die (rein in Python geparste) Datei verarbeitet.
+    Verglichen wird nur das Datum aus DTSTART/DTEND, mit 2 Tagen Puffer für Zeitzonen.
+    Wiederholungen, Overrides und Absagen (STATUS:CANCELLED) bleiben immer erhalten,
+    ebenso Termine im Zweifel (kein Datum gefunden, DURATION ohne DTEND).
+    """
+    lo = (first_day - timedelta(days=2)).strftime("%Y%m%d").encode()
+    hi = (last_day + timedelta(days=2)).strftime("%Y%m%d").encode()
+
+    def keep(match: re.Match) -> bytes:
+        block = match.group(0)
+        if _ALWAYS_KEEP_RE.search(block):
+            return block
+        start = _DTSTART_DATE_RE.search(block)
+        if not start:
+            return block
+        end = _DTEND_DATE_RE.search(block)
+        if end:
+            last = end.group(1)
+        elif _DURATION_RE.search(block):
+            last = b"99999999"
+        else:
+            last = start.group(1)
+        if start.group(1) > hi or last < lo:
+            return b""
+        return block
+
+    return _VEVENT_BLOCK_RE.sub(keep, content)
+
+
 # -------------------------- Termin in Wochenstruktur schreiben --------------------------
 
+@dataclass(slots=True)
+class Event:
+    """Ein Termin an einem Tag, fertig für die Ausgabe (Texte bereits HTML-escaped)."""
+    time: str
+    summary: str
+    loc_html: str
+    # Ganztägig zuerst, dann Startzeit, dann Titel
+    sort_key: tuple[bool, datetime, str]
+
+
 def add_event_local(
-    week_events: Dict[date, List[Dict[str, Any]]],
+    week_events: List[List[Event | None]],
+    events_by_key: Dict[str, List[tuple[int, int]]],
+    event_key: str,
     component,
     start_local: datetime,
     end_local: datetime,
     summary: str,
-    location: str,
-    week_days_local: set[date],
-    event_uid: str | None,
+    loc_html: str,
+    week_start_ord: int,
 ) -> None:
-    """Fügt ein (ggf. mehrtägiges) Ereignis allen betroffenen lokalen Tagen hinzu."""
+    """
+    Fügt ein (ggf. mehrtägiges) Ereignis allen betroffenen lokalen Tagen hinzu.
+    week_events hat je Wochentag (Mo–Fr) eine Liste, Index = Tage ab week_start_ord (Montag).
+    summary muss bereits HTML-escaped sein, loc_html ist das fertige Fragment aus location_html().
+    Die Positionen werden unter event_key in events_by_key vermerkt (für Absagen).
+    """
     all_day = is_all_day_component(component)
 
     # DTEND ist exklusiv: wenn 00:00 und Dauer > 0, gilt der Vortag als letzter voller Tag
@@ -81,61 +315,48 @@ def add_event_local(
         end_local.time() == time.min and end_local.date() > start_local.date()
     )
 
-    current = start_local.date()
-    while current <= loop_end_date:
-        if current in week_days_local:
-            if all_day:
-                time_str = "Ganztägig"
-                is_all = True
+    summary_lower = summary.lower()
+    # HH:MM direkt aus den Feldern (ohne strftime/__format__)
+    start_hm = f"{start_local.hour:02d}:{start_local.minute:02d}"
+    end_hm = f"{end_local.hour:02d}:{end_local.minute:02d}"
+
+    # Nur die Tage im Schnitt mit Mo–Fr durchlaufen (als Ordinalzahlen)
+    start_ord = start_local.toordinal()
+    end_ord = loop_end_date.toordinal()
+    for off in range(max(0, start_ord - week_start_ord), min(4, end_ord - week_start_ord) + 1):
+        day_ord = week_start_ord + off
+        if all_day:
+            time_str = "Ganztägig"
+            is_all = True
+        else:
+            if same_day:
+                time_str = f"{start_hm} – {end_hm}"
+            elif ends_midnight_next and day_ord == start_ord:
+                # 24h-Block: 00:00 – 00:00 → Ganztägig
+                time_str = "Ganztägig" if start_local.time() == time.min else f"{start_hm} – 00:00"
+            elif day_ord == start_ord:
+                time_str = f"Start: {start_hm}"
+            elif day_ord == end_ord and end_local.time() > time.min:
+                time_str = f"Ende: {end_hm}"
             else:
-                if same_day:
-                    time_str = f"{start_local:%H:%M} – {end_local:%H:%M}"
-                elif ends_midnight_next and current == start_local.date():
-                    # 24h-Block: 00:00 – 00:00 → Ganztägig
-                    time_str = "Ganztägig" if start_local.time() == time.min else f"{start_local:%H:%M} – 00:00"
-                elif current == start_local.date():
-                    time_str = f"Start: {start_local:%H:%M}"
-                elif current == loop_end_date and end_local.time() > time.min:
-                    time_str = f"Ende: {end_local:%H:%M}"
-                else:
-                    time_str = "Ganztägig"
-                is_all = (time_str == "Ganztägig")
-
-            event_data = {
-                "summary": summary,
-                "location": location,
-                "time": time_str,
-                "is_all_day": is_all,
-                "start_time": start_local,  # für Sortierung
-            }
-            if event_uid:
-                event_data["uid"] = event_uid
-            week_events[current].append(event_data)
-        current += timedelta(days=1)
+                time_str = "Ganztägig"
+            is_all = (time_str == "Ganztägig")
+
+        day_events = week_events[off]
+        day_events.append(
+            Event(
+                time=time_str,
+                summary=summary,
+                loc_html=loc_html,
+                sort_key=(not is_all, start_local, summary_lower),
+            )
+        )
+        events_by_key.setdefault(event_key, []).append((off, len(day_events) - 1))
 
 
 # ------------------------------------ HTML rendern -------------------------------------
 
-def render_html(
-    week_events: Dict[date, List[Dict[str, Any]]],
-    monday_local: date,
-    friday_local: date,
-    now_local_dt: datetime,
-) -> str:
-    calendar_week = now_local_dt.isocalendar()[1]
-    tz_local = now_local_dt.tzinfo  # type: ignore
-    timestamp_local = datetime.now(tz_local).strftime("%d.%m.%Y um %H:%M:%S Uhr")
-
-    def fmt_short(d: date) -> str:
-        return d.strftime("%d.%m.")
-
-    date_range_str = f"{fmt_short(monday_local)}–{fmt_short(friday_local)}"
-    today_local_date = now_local_dt.date()
-
-    days = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"]
-
-    parts: List[str] = []
-    parts.append(f"""<!DOCTYPE html>
+_HTML_HEADER_TEMPLATE = """<!DOCTYPE html>
 <html lang="de">
 <head>
 <meta charset="UTF-8">
@@ -323,45 +544,58 @@ footer.foot {{
 </header>
 
 <main class="container" role="main">
-  <section class="grid" aria-label="Wochentage">""")
+  <section class="grid" aria-label="Wochentage">"""
+
+_DAY_TEMPLATE = (
+    '<article class="day{cls}" aria-labelledby="d{i}-label">'
+    '<div class="day-header"><div id="d{i}-label" class="day-name">{name}</div>'
+    '<div class="day-date">{date}</div></div>'
+    '<div class="events">{events}</div></article>'
+)
+_EVENT_TEMPLATE = (
+    '<article class="event"><h3 class="event-time">{ev.time}</h3>'
+    '<div class="event-body"><div class="summary">{ev.summary}</div>{ev.loc_html}</div></article>'
+)
+_NO_EVENTS = '<div class="no-events">–</div>'
+_DAY_NAMES = ("Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag")
+
+
+def render_html(
+    week_events: List[List[Event]],
+    monday_local: date,
+    friday_local: date,
+    now_local_dt: datetime,
+) -> str:
+    calendar_week = now_local_dt.isocalendar().week
+    tz_local = now_local_dt.tzinfo  # type: ignore
+    timestamp_local = datetime.now(tz_local).strftime("%d.%m.%Y um %H:%M:%S Uhr")
+
+    def fmt_short(d: date) -> str:
+        return f"{d.day:02d}.{d.month:02d}."
 
-    for i, day_name in enumerate(days):
+    date_range_str = f"{fmt_short(monday_local)}–{fmt_short(friday_local)}"
+    today_local_date = now_local_dt.date()
+
+    parts: List[str] = [
+        _HTML_HEADER_TEMPLATE.format(calendar_week=calendar_week, date_range_str=date_range_str)
+    ]
+
+    for i, day_name in enumerate(_DAY_NAMES):
         current_date = monday_local + timedelta(days=i)
-        events = week_events.get(current_date, [])
-        # Ganztägig zuerst, dann Startzeit, dann Titel
-        events.sort(key=lambda x: (not x["is_all_day"], x["start_time"], x["summary"].lower()))
+        events = week_events[i]
+        events.sort(key=operator.attrgetter("sort_key"))
         is_today_cls = " today" if current_date == today_local_date else ""
 
         parts.append(
-            "".join(
-                [
-                    f'<article class="day{is_today_cls}" aria-labelledby="d{i}-label">',
-                    f'<div class="day-header"><div id="d{i}-label" class="day-name">{day_name}</div>',
-                    f'<div class="day-date">{current_date.strftime("%d.%m.")}</div></div>',
-                    '<div class="events">',
-                ]
+            _DAY_TEMPLATE.format(
+                cls=is_today_cls,
+                i=i,
+                name=day_name,
+                date=fmt_short(current_date),
+                events="".join(_EVENT_TEMPLATE.format(ev=ev) for ev in events) or _NO_EVENTS,
             )
         )
 
-        if not events:
-            parts.append('<div class="no-events">–</div>')
-        else:
-            for ev in events:
-                loc_html = ""
-                if ev.get("location"):
-                    loc_html = f'<div class="meta">{html.escape(ev["location"])}</div>'
-                body_html = f'<div class="summary">{ev["summary"]}</div>{loc_html}'
-                parts.append(
-                    "".join(
-                        [
-                            f'<article class="event"><h3 class="event-time">{ev["time"]}</h3>',
-                            f'<div class="event-body">{body_html}</div></article>',
-                        ]
-                    )
-                )
-
-        parts.append("</div></article>")
-
     parts.append(
         f'</section></main><footer class="foot" role="contentinfo">Kalender zuletzt aktualisiert am {timestamp_local}</footer></body></html>'
     )
@@ -376,17 +610,6 @@ def erstelle_kalender_html() -> None:
         print("Fehler: Die Environment-Variable 'ICS_URL' ist nicht gesetzt!", file=sys.stderr)
         sys.exit(1)
 
-    print("Lade Kalender von der bereitgestellten URL...")
-
-    try:
-        # WICHTIG: Bytes, nicht .text
-        response = requests.get(ics_url, timeout=30)
-        response.raise_for_status()
-        cal = Calendar.from_ical(response.content)
-    except Exception as e:
-        print(f"Fehler beim Herunterladen/Parsen der ICS-Datei: {e}", file=sys.stderr)
-        sys.exit(2)
-
     tz_vienna = ZoneInfo("Europe/Vienna")
     now_local = datetime.now(tz_vienna)
 
@@ -397,30 +620,58 @@ def erstelle_kalender_html() -> None:
     monday_local = start_of_week_local_dt.date()
     friday_local = (start_of_week_local_dt + timedelta(days=4)).date()
 
-    # Zielstruktur (lokale Kalendertage)
-    week_days_local = {monday_local + timedelta(days=i) for i in range(5)}
-    week_events: Dict[date, List[Dict[str, Any]]] = {d: [] for d in week_days_local}
-
-    # De-Duping über (UID oder summary|location, Startzeit lokal)
-    dedup_keys: set[tuple[str, str]] = set()
-    cancelled_occurrences: set[tuple[str, str]] = set()
+    print("Lade Kalender von der bereitgestellten URL...")
 
-    # Overrides (RECURRENCE-ID) vorab sammeln
-    vevents = list(cal.walk("VEVENT"))
-    overrides: Dict[tuple[str, datetime], Any] = {}
-    for component in vevents:
-        rec_id_prop = component.get("recurrence-id")
-        if not rec_id_prop:
-            continue
-        uid = str(component.get("uid") or "").strip()
-        rec_local = to_local(rec_id_prop.dt, tz_vienna)
-        overrides[(uid, rec_local)] = component
+    try:
+        # WICHTIG: Bytes, nicht .text
+        content = fetch_ics(ics_url)
+        try:
+            cal = Calendar.from_ical(filter_ics_window(content, monday_local, friday_local))
+        except Exception:
+            # Vorfilter im Zweifel übergehen und die komplette Datei parsen
+            cal = Calendar.from_ical(content)
+    except Exception as e:
+        print(f"Fehler beim Herunterladen/Parsen der ICS-Datei: {e}", file=sys.stderr)
+        sys.exit(2)
 
-    def add_occurrence(component, occ_start_local: datetime, occ_end_local: datetime, summary_str: str) -> None:
+    # Zielstruktur: eine Liste je Wochentag Mo–Fr (Index = Tage ab Montag)
+    week_start_ord = monday_local.toordinal()
+    week_events: List[List[Event | None]] = [[] for _ in range(5)]
+    # Positionen (Tag, Index) je De-Dup-Schlüssel, damit Absagen nicht alle Tage durchsuchen müssen
+    events_by_key: Dict[str, List[tuple[int, int]]] = {}
+
+    # De-Duping über "UID oder summary|location" + NUL + Startzeit (Unix-Sekunden)
+    dedup_keys: set[str] = set()
+    cancelled_occurrences: set[str] = set()
+
+    # Ein Durchlauf: Overrides (RECURRENCE-ID) in die Tabelle, alles andere in masters.
+    # Abgesagte Overrides landen zusätzlich in masters, damit ihre Absage greift.
+    # uid/status/dtstart werden dabei einmal gelesen und als Tupel weitergereicht.
+    masters: List[tuple[Any, str, Any, str, Any]] = []
+    overrides: Dict[tuple[str, datetime], tuple[Any, str, Any, str]] = {}
+    for component in cal.walk("VEVENT"):
         uid = str(component.get("uid") or "").strip()
-        location_str = str(component.get("location") or "").strip()
+        status = str(component.get("status") or "").strip().upper()
+        rec_id_prop = component.get("recurrence-id")
+        dtstart_prop = component.get("dtstart")
+        if rec_id_prop:
+            rec_local = to_local(rec_id_prop.dt, tz_vienna)
+            overrides[(uid, rec_local)] = (component, uid, dtstart_prop, status)
+            if status != "CANCELLED":
+                continue
+        masters.append((component, uid, dtstart_prop, status, rec_id_prop))
+
+    def add_occurrence(
+        component,
+        occ_start_local: datetime,
+        occ_end_local: datetime,
+        summary_str: str,
+        uid: str,
+        location_str: str,
+        loc_html: str,
+    ) -> None:
         dedup_id = uid or f"{summary_str}|{location_str}"
-        dedup_key = (dedup_id, occ_start_local.isoformat())
+        dedup_key = f"{dedup_id}\x00{occ_start_local.timestamp():.0f}"
         if dedup_key in cancelled_occurrences:
             return
         if dedup_key in dedup_keys:
@@ -428,27 +679,24 @@ def erstelle_kalender_html() -> None:
         dedup_keys.add(dedup_key)
         add_event_local(
             week_events,
+            events_by_key,
+            dedup_key,
             component,
             occ_start_local,
             occ_end_local,
             summary_str,
-            location_str,
-            week_days_local,
-            uid if uid else None,
+            loc_html,
+            week_start_ord,
         )
         cancelled_occurrences.discard(dedup_key)
 
-    for component in vevents:
+    for component, uid, dtstart_prop, status, rec_id_prop in masters:
         summary_str = ""
         try:
             # Titel + Ort
             raw_summary = str(component.get("summary") or "Ohne Titel")
-            summary_str = html.escape(raw_summary)
+            summary_str = _esc(raw_summary)
             location_str = str(component.get("location") or "").strip()
-            uid = str(component.get("uid") or "").strip()
-            status = str(component.get("status") or "").strip().upper()
-            rec_id_prop = component.get("recurrence-id")
-            dtstart_prop = component.get("dtstart")
 
             if status == "CANCELLED":
                 if rec_id_prop:
@@ -458,39 +706,21 @@ def erstelle_kalender_html() -> None:
                 else:
                     continue
 
-                cancel_key = (
-                    uid if uid else f"{summary_str}|{location_str}",
-                    cancel_start_local.isoformat(),
-                )
+                cancel_id = uid if uid else f"{summary_str}|{location_str}"
+                cancel_key = f"{cancel_id}\x00{cancel_start_local.timestamp():.0f}"
                 cancelled_occurrences.add(cancel_key)
                 dedup_keys.discard(cancel_key)
 
-                for events in week_events.values():
-                    if uid:
-                        events[:] = [
-                            ev
-                            for ev in events
-                            if not (
-                                ev.get("start_time") == cancel_start_local
-                                and ev.get("uid") == uid
-                            )
-                        ]
-                    else:
-                        events[:] = [
-                            ev
-                            for ev in events
-                            if not (
-                                ev.get("start_time") == cancel_start_local
-                                and ev.get("summary") == summary_str
-                                and ev.get("location") == location_str
-                            )
-                        ]
+                # bereits eingetragene Vorkommen entwerten (Lücken werden vor dem Rendern entfernt).
+                # Getroffen wird nur derselbe De-Dup-Schlüssel: eine Absage ohne UID entfernt also
+                # nur Termine ohne UID mit gleichem Titel/Ort/Start, keine gleichnamigen mit UID.
+                for day, idx in events_by_key.pop(cancel_key, []):
+                    week_events[day][idx] = None
                 continue
 
-            if rec_id_prop:
-                continue
             if not dtstart_prop:
                 continue
+            loc_html = location_html(location_str)
 
             # Start/Ende (lokal)
             dtstart_raw = dtstart_prop.dt
@@ -509,32 +739,33 @@ def erstelle_kalender_html() -> None:
             duration = end_local - start_local
             pad = duration if duration > timedelta(0) else timedelta(0)
 
+            # leicht nach vorne ziehen, damit Events, die am Sonntag 24h laufen, montags erscheinen
+            search_start = start_of_week_local_dt - pad
+            search_end = end_of_week_local_dt
+
             # Wiederholungen (RRULE)
             rrule_prop = component.get("rrule")
             if rrule_prop:
-                # EXDATE sammeln
-                exdates_local: set[datetime] = set()
+                # EXDATE sammeln (nur die im Suchfenster sind relevant)
                 ex_prop = component.get("exdate")
                 ex_list = ex_prop if isinstance(ex_prop, list) else ([ex_prop] if ex_prop else [])
-                for ex in ex_list:
-                    for d in ex.dts:
-                        exdates_local.add(to_local(d.dt, tz_vienna))
-
-                rule = rrulestr(rrule_prop.to_ical().decode(), dtstart=start_local)
-                # leicht nach vorne ziehen, damit Events, die am Sonntag 24h laufen, montags erscheinen
-                search_start = start_of_week_local_dt - pad
-                search_end = end_of_week_local_dt
-
-                for occ_start_local in rule.between(search_start, search_end, inc=True):
-                    occ_start_local = to_local(occ_start_local, tz_vienna)
+                exdates_local: set[datetime] = {
+                    t
+                    for ex in ex_list
+                    for d in ex.dts
+                    if search_start <= (t := to_local(d.dt, tz_vienna)) <= search_end
+                }
+
+                # Vorkommen tragen bereits die tzinfo von start_local (tz_vienna)
+                for occ_start_local in fast_between(rrule_prop, start_local, search_start, search_end):
                     if occ_start_local in exdates_local:
                         continue
                     if (uid, occ_start_local) in overrides:
                         continue
-                    add_occurrence(component, occ_start_local, occ_start_local + duration, summary_str)
+                    add_occurrence(component, occ_start_local, occ_start_local + duration, summary_str, uid, location_str, loc_html)
             else:
                 # Einzeltermin
-                add_occurrence(component, start_local, end_local, summary_str)
+                add_occurrence(component, start_local, end_local, summary_str, uid, location_str, loc_html)
 
             # Zusätzliche Einzeltermine (RDATE)
             rdate_prop = component.get("rdate")
@@ -542,24 +773,26 @@ def erstelle_kalender_html() -> None:
             for r in rdate_list:
                 for d in r.dts:
                     r_local = to_local(d.dt, tz_vienna)
+                    if not search_start <= r_local <= search_end:
+                        continue
                     if (uid, r_local) in overrides:
                         continue
-                    add_occurrence(component, r_local, r_local + duration, summary_str)
+                    add_occurrence(component, r_local, r_local + duration, summary_str, uid, location_str, loc_html)
 
         except Exception as e:
             print(f"Fehler beim Verarbeiten eines Termins ('{summary_str}'): {e}", file=sys.stderr)
 
-    for override_component in overrides.values():
+    for override_component, uid, dtstart_prop, status in overrides.values():
         summary_str = ""
         try:
-            status = str(override_component.get("status") or "").strip().upper()
             if status == "CANCELLED":
                 continue
 
             raw_summary = str(override_component.get("summary") or "Ohne Titel")
-            summary_str = html.escape(raw_summary)
+            summary_str = _esc(raw_summary)
+            location_str = str(override_component.get("location") or "").strip()
+            loc_html = location_html(location_str)
 
-            dtstart_prop = override_component.get("dtstart")
             if not dtstart_prop:
                 continue
 
@@ -574,18 +807,25 @@ def erstelle_kalender_html() -> None:
                 dtend_raw = dtend_prop.dt if dtend_prop else dtstart_prop.dt
                 occ_end_local = to_local(dtend_raw, tz_vienna)
 
-            add_occurrence(override_component, occ_start_local, occ_end_local, summary_str)
+            add_occurrence(override_component, occ_start_local, occ_end_local, summary_str, uid, location_str, loc_html)
         except Exception as e:
             print(
                 f"Fehler beim Verarbeiten eines Override-Termins ('{summary_str}'): {e}",
                 file=sys.stderr,
             )
 
+    for events in week_events:
+        events[:] = [ev for ev in events if ev is not None]
+
     # HTML erzeugen & schreiben
     html_str = render_html(week_events, monday_local, friday_local, now_local)
+    data = html_str.encode("utf-8")
     os.makedirs(os.path.dirname(OUTPUT_HTML_FILE), exist_ok=True)
-    with open(OUTPUT_HTML_FILE, "w", encoding="utf-8") as f:
-        f.write(html_str)
+    # Erst temporär schreiben, dann atomar ersetzen: Leser sehen nie eine halbe Datei
+    tmp_file = OUTPUT_HTML_FILE + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, OUTPUT_HTML_FILE)
 
     print(f"Fertig! Wochenkalender wurde erfolgreich in '{OUTPUT_HTML_FILE}' erstellt.")
 